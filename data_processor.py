@@ -4,13 +4,36 @@ Simple JetBrains Plugins Data Processor
 Converts crawled plugin data to CSV format.
 """
 
+import argparse
 import json
 import csv
 import logging
+import mmap
+import os
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice, repeat
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 import sqlite3
 
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional, fall back to the standard library
+    def _json_loads(data):
+        # json.loads() does not accept memoryview, bytes() is a no-op for bytes input
+        return json.loads(bytes(data))
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, only needed for Parquet output
+    pa = pq = None
+
 
 # Configure logging
 logging.basicConfig(
@@ -19,12 +42,131 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Combined file written by the crawler, one plugin per line
+NDJSON_FILE_NAME = 'plugins.ndjson'
+
+# Number of rows buffered before they are sent to SQLite and Arrow
+WRITE_BATCH_SIZE = 1000
+
+
+@lru_cache(maxsize=65536)
+def _format_day(day: int) -> str:
+    """Format a number of days since the epoch as a UTC date."""
+    return datetime.fromtimestamp(day * 86400, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def _format_date(timestamp_ms) -> str:
+    """Format a millisecond timestamp as a date."""
+    return _format_day(timestamp_ms // 86_400_000) if timestamp_ms else ''
+
+
+@lru_cache(maxsize=None)
+def _build_plan(fields: Tuple[Tuple[str, str], ...]) -> List[Tuple[str, Callable[[Dict], Any]]]:
+    """
+    Build one getter per output field.
+
+    Field paths are resolved once here instead of for every plugin; the
+    plan is cached so each worker process builds it only once.
+    """
+    plan = []
+    for field_name, json_path in fields:
+        # Special handling for specific fields
+        if field_name == 'tags':
+            getter = lambda plugin, key=json_path: ','.join(plugin.get(key) or ())
+        elif field_name == 'date':
+            getter = lambda plugin, key=json_path: _format_date(plugin.get(key))
+        elif '_' in json_path:  # Handle nested fields (vendor_name)
+            parent, child = json_path.split('_')
+            getter = lambda plugin, parent=parent, child=child: plugin.get(parent, {}).get(child, '')
+        else:
+            getter = lambda plugin, key=json_path: plugin.get(key, '')
+        plan.append((field_name, getter))
+    return plan
+
+
+def _extract_rows(plugins: Iterable[Dict], fields: Dict[str, str]) -> List[Tuple]:
+    """Extract the configured fields of each plugin as a row tuple."""
+    getters = [getter for _, getter in _build_plan(tuple(fields.items()))]
+    return [tuple([getter(plugin) for getter in getters]) for plugin in plugins]
+
+
+def process_file(file_path: Path, fields: Dict[str, str]) -> List[Tuple]:
+    """
+    Load a single page file and extract the configured fields of its plugins.
+
+    Kept at module level so it can be sent to worker processes.
+    """
+    # Parse straight from the page cache instead of copying into a read buffer
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            json_data = _json_loads(view)
+    return _extract_rows(json_data.get('plugins', []), fields)
+
+
+def process_lines(lines: List[bytes], fields: Dict[str, str]) -> List[Tuple]:
+    """
+    Parse a chunk of NDJSON lines and extract the configured fields of each plugin.
+
+    Kept at module level so it can be sent to worker processes.
+    """
+    return _extract_rows((_json_loads(line) for line in lines if line.strip()), fields)
+
+
+def _iter_line_chunks(f: BinaryIO) -> Iterator[List[bytes]]:
+    """Read a file in chunks of WRITE_BATCH_SIZE lines."""
+    while True:
+        lines = list(islice(f, WRITE_BATCH_SIZE))
+        if not lines:
+            break
+        yield lines
+
+
+def _map_bounded(executor: Executor, fn: Callable, items: Iterable, fields: Dict[str, str],
+                 window: int) -> Iterator[List[Tuple]]:
+    """
+    Like executor.map(), but keep at most window tasks in flight.
+
+    Inputs are pulled lazily, so a large file is never read into memory up front.
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item, fields))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _to_record_batch(rows: List[Tuple], schema: 'pa.Schema') -> 'pa.RecordBatch':
+    """Convert row tuples to an Arrow record batch, mapping empty values to nulls."""
+    arrays = []
+    for column, field in zip(zip(*rows), schema):
+        if not pa.types.is_string(field.type):
+            column = [None if value == '' else value for value in column]
+        arrays.append(pa.array(column, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _drop_duplicates(rows: List[Tuple], seen_ids: Set, id_index: int) -> List[Tuple]:
+    """Keep only rows whose id has not been seen yet, recording new ids."""
+    unique_rows = []
+    for row in rows:
+        plugin_id = row[id_index]
+        if plugin_id not in seen_ids:
+            seen_ids.add(plugin_id)
+            unique_rows.append(row)
+    return unique_rows
+
 
 class PluginDataProcessor:
     """Process and convert JetBrains plugin data to CSV format."""
 
-    def __init__(self, plugins_dir: str = 'plugins'):
+    def __init__(self, plugins_dir: str = 'plugins', max_workers: Optional[int] = None,
+                 use_threads: bool = False):
         self.plugins_dir = Path(plugins_dir)
+        self.max_workers = max_workers
+        # Threads skip process start-up and result pickling, processes scale the transform
+        self.use_threads = use_threads
         # Define the fields we want to extract
         self.fields = {
             'id': 'id',
@@ -36,68 +178,144 @@ class PluginDataProcessor:
             'tags': 'tags',
             'date': 'cdate'
         }
+        # Column types for Parquet output, any other field is stored as a string
+        self.parquet_types = {
+            'id': 'int64',
+            'downloads': 'int64',
+            'rating': 'float64'
+        }
 
-    def process_plugins(self, output_file: str = 'plugins.csv') -> None:
-        """Load JSON files and convert to CSV."""
-        all_plugins = []
+    def _parquet_schema(self) -> 'pa.Schema':
+        """Build the Parquet schema for the configured fields."""
+        return pa.schema([
+            (field_name, pa.type_for_alias(self.parquet_types.get(field_name, 'string')))
+            for field_name in self.fields
+        ])
 
-        # Load all JSON files
-        try:
-            for file_path in self.plugins_dir.glob('*.json'):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
-                    plugins_data = json_data.get('plugins', [])
-                    all_plugins.extend(plugins_data)
-            logger.info(f"Loaded {len(all_plugins)} plugins from {len(list(self.plugins_dir.glob('*.json')))} files")
-        except Exception as e:
-            logger.error(f"Error loading plugins: {e}")
+    def _page_files(self) -> List[Path]:
+        """List the crawled page files in page order."""
+        return sorted(
+            self.plugins_dir.glob('page_*.json'),
+            key=lambda path: int(path.stem.split('_')[1])
+        )
+
+    def _iter_rows(self) -> Iterator[List[Tuple]]:
+        """
+        Yield extracted rows in batches.
+
+        Work is spread over a pool of worker processes, or threads when
+        use_threads is set. When the crawler produced the combined NDJSON
+        file it is read sequentially and its lines are parsed in chunks by
+        the pool; otherwise the page files are parsed by the pool.
+        """
+        executor_class = ThreadPoolExecutor if self.use_threads else ProcessPoolExecutor
+        with executor_class(max_workers=self.max_workers) as executor:
+            ndjson_file = self.plugins_dir / NDJSON_FILE_NAME
+            if ndjson_file.exists():
+                logger.info(f"Reading {ndjson_file}")
+                window = 2 * (self.max_workers or os.cpu_count() or 1)
+                with open(ndjson_file, 'rb') as f:
+                    yield from _map_bounded(executor, process_lines, _iter_line_chunks(f),
+                                            self.fields, window)
+                return
+
+            files = self._page_files()
+            logger.info(f"Found {len(files)} files in {self.plugins_dir}")
+            yield from executor.map(process_file, files, repeat(self.fields), chunksize=4)
+
+    def process_plugins(self, output_file: str = 'plugins.csv', parquet_file: Optional[str] = None) -> None:
+        """
+        Load JSON files and write them to CSV and SQLite in a single pass.
+
+        Args:
+            output_file: Path of the CSV file to write
+            parquet_file: Optional path of a Snappy-compressed Parquet file
+                to write as well (requires pyarrow)
+        """
+        if parquet_file and pa is None:
+            logger.error("pyarrow is required for Parquet output")
             return
 
-        # Prepare data for CSV
-        processed_data = []
-        for plugin in all_plugins:
-            row = {}
-            for field_name, json_path in self.fields.items():
-                if '_' in json_path:  # Handle nested fields (vendor_name)
-                    parent, child = json_path.split('_')
-                    value = plugin.get(parent, {}).get(child, '')
-                else:
-                    value = plugin.get(json_path, '')
-
-                # Special handling for specific fields
-                if field_name == 'tags':
-                    value = ','.join(value) if value else ''
-                elif field_name == 'date':
-                    value = datetime.fromtimestamp(value / 1000).strftime('%Y-%m-%d') if value else ''
-
-                row[field_name] = value
-            processed_data.append(row)
-
-        # Write to CSV
+        schema = self._parquet_schema() if parquet_file else None
+        parquet_writer = None
+        loaded_plugins = 0
+        total_plugins = 0
+
+        # Transactions are managed explicitly below
+        conn = sqlite3.connect('plugins.db', isolation_level=None)
         try:
+            conn.executescript('PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA temp_store=MEMORY;')
+            if schema is not None:
+                parquet_writer = pq.ParquetWriter(parquet_file, schema, compression='snappy')
+
             with open(output_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=self.fields.keys())
-                writer.writeheader()
-                writer.writerows(processed_data)
-            logger.info(f"Successfully wrote {len(processed_data)} plugins to {output_file}")
+                writer = csv.writer(f)
+                writer.writerow(self.fields.keys())
+
+                # Recreate the table in the same transaction so a re-run matches a fresh
+                # run and tables from older versions (untyped, no primary key) are replaced
+                c = conn.cursor()
+                c.execute('BEGIN')
+                c.execute('DROP TABLE IF EXISTS plugins')
+                c.execute(
+                    'CREATE TABLE plugins ('
+                    'id INTEGER PRIMARY KEY, name TEXT, downloads INTEGER, rating REAL, '
+                    'pricing TEXT, vendor TEXT, tags TEXT, date TEXT)'
+                )
+                insert_sql = 'INSERT OR REPLACE INTO plugins VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+
+                # Overlapping or retried pages can repeat plugins, keep the first occurrence
+                id_index = list(self.fields).index('id')
+                seen_ids = set()
+
+                # Rows may be extracted in worker processes, they are written here
+                batch = []
+                for rows in self._iter_rows():
+                    loaded_plugins += len(rows)
+                    rows = _drop_duplicates(rows, seen_ids, id_index)
+                    writer.writerows(rows)
+                    batch.extend(rows)
+                    total_plugins += len(rows)
+
+                    if len(batch) >= WRITE_BATCH_SIZE:
+                        c.executemany(insert_sql, batch)
+                        if parquet_writer is not None:
+                            parquet_writer.write_batch(_to_record_batch(batch, schema))
+                        batch.clear()
+
+                if batch:
+                    c.executemany(insert_sql, batch)
+                    if parquet_writer is not None:
+                        parquet_writer.write_batch(_to_record_batch(batch, schema))
+            c.execute('COMMIT')
         except Exception as e:
-            logger.error(f"Error writing CSV: {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            logger.error(f"Error processing plugins: {e}")
+            return
+        finally:
+            if parquet_writer is not None:
+                parquet_writer.close()
+            conn.close()
 
-        # drop to sqlite
-        conn = sqlite3.connect('plugins.db')
-        c = conn.cursor()
-        c.execute('CREATE TABLE plugins (id, name, downloads, rating, pricing, vendor, tags, date)')
-        for plugin in processed_data:
-            c.execute('INSERT INTO plugins VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (plugin['id'], plugin['name'], plugin['downloads'], plugin['rating'], plugin['pricing'], plugin['vendor'], plugin['tags'], plugin['date']))
-        conn.commit()
-        conn.close()
-        logger.info(f"Successfully wrote {len(processed_data)} plugins to plugins.db")
+        logger.info(f"Loaded {loaded_plugins} plugins")
+        if loaded_plugins > total_plugins:
+            logger.info(f"Skipped {loaded_plugins - total_plugins} duplicate plugins")
+        logger.info(f"Successfully wrote {total_plugins} plugins to {output_file} and plugins.db")
+        if parquet_file:
+            logger.info(f"Successfully wrote {total_plugins} plugins to {parquet_file}")
 
 
 def main():
     """Main entry point."""
-    processor = PluginDataProcessor()
-    processor.process_plugins()
+    parser = argparse.ArgumentParser(description='Convert crawled plugin data to CSV and SQLite.')
+    parser.add_argument('--output', default='plugins.csv', help='CSV file to write')
+    parser.add_argument('--parquet', metavar='PATH', help='also write a Parquet file (requires pyarrow)')
+    parser.add_argument('--threads', action='store_true', help='parse page or NDJSON input in threads instead of processes')
+    args = parser.parse_args()
+
+    processor = PluginDataProcessor(use_threads=args.threads)
+    processor.process_plugins(args.output, parquet_file=args.parquet)
 
 
 if __name__ == '__main__':
@@ -6,14 +6,35 @@ This module provides functionality to crawl and download plugin data
 from the JetBrains Plugin Marketplace.
 """
 
+import argparse
 import os
+import glob
 import json
 import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple, Union
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
+try:
+    import orjson
+
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional, fall back to the standard library
+    def _json_dumps(data) -> bytes:
+        return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    _json_loads = json.loads
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,6 +46,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+CHECKPOINT_FILE = os.path.join('plugins', '_checkpoint.json')
+NDJSON_FILE = os.path.join('plugins', 'plugins.ndjson')
+
 
 @dataclass
 class MarketplaceConfig:
@@ -32,6 +56,10 @@ class MarketplaceConfig:
     base_url: str = 'https://plugins.jetbrains.com/api/searchPlugins'
     headers: Dict[str, str] = None
     products: List[str] = None
+    request_delay: Tuple[float, float] = (0.1, 0.4)
+    max_concurrent_requests: int = 4
+    max_retries: int = 3
+    rate_limit_penalty: float = 60.0
 
     def __post_init__(self):
         if self.headers is None:
@@ -55,10 +83,27 @@ class MarketplaceConfig:
 class JetBrainsMarketplaceCrawler:
     """Crawler for JetBrains Marketplace plugins."""
 
-    def __init__(self, config: MarketplaceConfig = None):
+    def __init__(self, config: MarketplaceConfig = None, max_workers: int = 8):
         self.config = config or MarketplaceConfig()
+        self.max_workers = max_workers
+        self.session = self._create_session()
+        self._host_semaphore = threading.BoundedSemaphore(self.config.max_concurrent_requests)
+        self._throttle_lock = threading.Lock()
+        self._withheld_slots = 0
+        # Index of the first page past the end of results, pages from here on are not fetched
+        self._page_limit = 0
+        self._page_limit_lock = threading.Lock()
         self._setup_output_directory()
 
+    def _create_session(self) -> requests.Session:
+        """Create an HTTP session that reuses connections across requests."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self.config.headers)
+        return session
+
     def _setup_output_directory(self) -> None:
         """Create output directory if it doesn't exist."""
         os.makedirs('plugins', exist_ok=True)
@@ -75,17 +120,60 @@ class JetBrainsMarketplaceCrawler:
             f"{products_param}"
         )
 
+    def _retry_after(self, response: requests.Response, attempt: int) -> float:
+        """Read the delay requested by a rate-limited response, in seconds."""
+        value = response.headers.get('Retry-After', '')
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(value)
+                delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                delay = float(2 ** attempt)
+
+        # Ignore malformed values such as nan/inf and never wait longer than the penalty
+        if not math.isfinite(delay):
+            delay = float(2 ** attempt)
+        return min(max(delay, 0.0), self.config.rate_limit_penalty)
+
+    def _throttle(self) -> None:
+        """Withhold one request slot for the penalty period after a rate limit."""
+        with self._throttle_lock:
+            if self._withheld_slots >= self.config.max_concurrent_requests - 1:
+                return
+            self._withheld_slots += 1
+        threading.Thread(target=self._withhold_slot, daemon=True).start()
+
+    def _withhold_slot(self) -> None:
+        """Hold a request slot for the rate limit penalty period."""
+        with self._host_semaphore:
+            time.sleep(self.config.rate_limit_penalty)
+        with self._throttle_lock:
+            self._withheld_slots -= 1
+
     def _make_request(self, offset: int, max_results: int = 100) -> Optional[List[Dict]]:
-        """Make API request for a specific offset."""
+        """Make API request for a specific offset, backing off when rate limited."""
         try:
             url = self._build_url(offset, max_results)
-            response = requests.get(
-                url,
-                headers=self.config.headers,
-                timeout=30
-            )
+            for attempt in range(self.config.max_retries + 1):
+                with self._host_semaphore:
+                    response = self.session.get(url, timeout=30)
+                    # Hold the slot through the pause so requests to the host stay spaced out
+                    time.sleep(random.uniform(*self.config.request_delay))
+
+                if response.status_code != 429 or attempt == self.config.max_retries:
+                    break
+
+                delay = self._retry_after(response, attempt)
+                logger.warning(f"Rate limited at offset {offset}, retrying in {delay:.1f}s")
+                self._throttle()
+                time.sleep(delay)
+
             response.raise_for_status()
-            return response.json()
+            logger.debug(f"Offset {offset}: {len(response.content)} bytes, "
+                         f"content-encoding {response.headers.get('Content-Encoding', 'identity')}")
+            return _json_loads(response.content)
         except RequestException as e:
             logger.error(f"Error making request for offset {offset}: {str(e)}")
             return None
@@ -93,54 +181,229 @@ class JetBrainsMarketplaceCrawler:
             logger.error(f"Error parsing response for offset {offset}: {str(e)}")
             return None
 
-    def _save_plugins(self, plugins: List[Dict], page: int) -> None:
-        """Save plugins data to JSON file."""
+    @staticmethod
+    def _has_content(path: str, data: bytes) -> bool:
+        """Check whether a file already holds exactly the given bytes."""
         try:
-            output_path = os.path.join('plugins', f'page_{page}.json')
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(plugins, f, indent=4)
+            if os.path.getsize(path) != len(data):
+                return False
+            with open(path, 'rb') as f:
+                return f.read() == data
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _remove_ndjson() -> None:
+        """Remove the combined NDJSON file if it exists."""
+        try:
+            os.remove(NDJSON_FILE)
+        except FileNotFoundError:
+            pass
+
+    def _save_plugins(self, plugins: List[Dict], page: int) -> bool:
+        """Save plugins data to JSON file, returning whether it was saved."""
+        output_path = os.path.join('plugins', f'page_{page}.json')
+        tmp_path = f'{output_path}.tmp'
+        data = _json_dumps(plugins)
+        try:
+            if self._has_content(output_path, data):
+                return True
+
+            # The combined file no longer matches the pages, it is rebuilt after the crawl
+            self._remove_ndjson()
+
+            # Write aside and rename so an interrupted write never leaves a partial page
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, output_path)
+            return True
         except IOError as e:
             logger.error(f"Error saving plugins for page {page}: {str(e)}")
+            return False
+
+    def _is_downloaded(self, page: int, plugins_per_page: int) -> bool:
+        """
+        Check whether a full page was already saved by a previous run.
+
+        A short page was the end of results at the time and may have grown
+        since, so it is fetched again.
+        """
+        output_path = os.path.join('plugins', f'page_{page}.json')
+        try:
+            with open(output_path, 'rb') as f:
+                plugins = self._extract_plugins(_json_loads(f.read()))
+        except (IOError, ValueError):
+            return False
+        return len(plugins) >= plugins_per_page
+
+    def _load_checkpoint(self) -> int:
+        """Load the number of the last page completed by a previous run."""
+        try:
+            with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+                return int(json.load(f).get('last_complete_page', 0))
+        except FileNotFoundError:
+            return 0
+        except (IOError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint: {str(e)}")
+            return 0
+
+    def _save_checkpoint(self, last_complete_page: int) -> None:
+        """Atomically record the last page completed without gaps."""
+        tmp_path = f'{CHECKPOINT_FILE}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'last_complete_page': last_complete_page}, f)
+            os.replace(tmp_path, CHECKPOINT_FILE)
+        except IOError as e:
+            logger.error(f"Error saving checkpoint: {str(e)}")
+
+    def _write_ndjson(self) -> None:
+        """Combine all saved pages into a single file with one plugin per line."""
+        page_files = sorted(
+            glob.glob(os.path.join('plugins', 'page_*.json')),
+            key=lambda path: int(os.path.basename(path)[len('page_'):-len('.json')])
+        )
+        tmp_path = f'{NDJSON_FILE}.tmp'
+        try:
+            with open(tmp_path, 'wb') as out:
+                for path in page_files:
+                    with open(path, 'rb') as f:
+                        plugins = self._extract_plugins(_json_loads(f.read()))
+                    out.writelines(_json_dumps(plugin) + b'\n' for plugin in plugins)
+            os.replace(tmp_path, NDJSON_FILE)
+            logger.info(f"Combined {len(page_files)} pages into {NDJSON_FILE}")
+        except (IOError, ValueError) as e:
+            logger.error(f"Error combining pages into {NDJSON_FILE}: {str(e)}")
+
+    @staticmethod
+    def _extract_plugins(response_data: Union[Dict, List]) -> List[Dict]:
+        """Return the list of plugins contained in an API response."""
+        if isinstance(response_data, dict):
+            return response_data.get('plugins', [])
+        return response_data
+
+    def _limit_pages(self, page_limit: int) -> None:
+        """Stop fetching pages at or after the given page index."""
+        with self._page_limit_lock:
+            self._page_limit = min(self._page_limit, page_limit)
 
-    def crawl(self, max_pages: int = 100, plugins_per_page: int = 100) -> int:
+    def _crawl_page(self, page: int, plugins_per_page: int, resume: bool = True) -> Optional[int]:
+        """
+        Fetch and save a single page.
+
+        Returns:
+            Number of plugins found on the page, 0 when the end of results
+            was reached or the request or save failed, None when the page
+            was already downloaded
+        """
+        if page >= self._page_limit:
+            return 0
+
+        if resume and self._is_downloaded(page + 1, plugins_per_page):
+            return None
+
+        response_data = self._make_request(page * plugins_per_page, plugins_per_page)
+
+        # The end of results may have been found while this request was in flight
+        if page >= self._page_limit:
+            return 0
+
+        plugins = self._extract_plugins(response_data) if response_data else []
+
+        if not plugins:
+            logger.info(f"No more plugins found at page {page + 1}")
+            self._limit_pages(page)
+            return 0
+
+        if not self._save_plugins(response_data, page + 1):
+            return 0
+
+        if len(plugins) < plugins_per_page:
+            logger.info(f"Final page reached at page {page + 1} "
+                        f"(got {len(plugins)} < {plugins_per_page})")
+            self._limit_pages(page + 1)
+
+        return len(plugins)
+
+    def crawl(self, max_pages: int = 100, plugins_per_page: int = 100, resume: bool = True) -> int:
         """
         Crawl the JetBrains Marketplace for plugins.
 
+        Pages are fetched concurrently; once a page comes back empty or
+        short, no requests are issued for the pages after it. When
+        resuming, full pages covered by the checkpoint or already present
+        on disk are not requested again; a short final page is always
+        fetched again. When any page changed, all saved pages are then
+        combined into a single NDJSON file.
+
         Args:
             max_pages: Maximum number of pages to crawl
             plugins_per_page: Number of plugins to fetch per request
+            resume: Skip pages downloaded by a previous run
 
         Returns:
             Total number of plugins crawled
         """
         total_plugins = 0
+        self._page_limit = max_pages
+
+        last_complete_page = self._load_checkpoint() if resume else 0
+        if last_complete_page:
+            logger.info(f"Resuming after page {last_complete_page}")
+
+        completed_pages = set()
 
-        for page in range(max_pages):
-            offset = page * plugins_per_page
-            plugins = self._make_request(offset, plugins_per_page)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._crawl_page, page, plugins_per_page, resume): page
+                for page in range(last_complete_page, max_pages)
+            }
+
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
 
-            if not plugins:
-                logger.info(f"No more plugins found after page {page}")
-                break
+                page = futures[future]
+                found = future.result()
 
-            if isinstance(plugins, list) and not plugins:
-                logger.info(f"Reached end of results at page {page}")
-                break
+                # Drop queued pages past the end of results, in-flight ones drain
+                for pending, pending_page in futures.items():
+                    if pending_page >= self._page_limit:
+                        pending.cancel()
 
-            total_plugins += len(plugins)
-            logger.info(f"Crawled page {page + 1}: Found {len(plugins)} plugins "
-                        f"(Total: {total_plugins})")
+                if found is None:
+                    logger.info(f"Skipping page {page + 1}: already downloaded")
+                elif not found:
+                    continue
+                else:
+                    total_plugins += found
+                    logger.info(f"Crawled page {page + 1}: Found {found} plugins "
+                                f"(Total: {total_plugins})")
 
-            self._save_plugins(plugins, page + 1)
+                # A short final page is not complete, later runs fetch it again
+                if found is None or found >= plugins_per_page:
+                    completed_pages.add(page + 1)
+                if last_complete_page + 1 in completed_pages:
+                    while last_complete_page + 1 in completed_pages:
+                        last_complete_page += 1
+                    self._save_checkpoint(last_complete_page)
 
+        # Saving a changed page removes the combined file, rebuild it only then
+        if not os.path.exists(NDJSON_FILE):
+            self._write_ndjson()
         return total_plugins
 
 
 def main():
     """Main entry point for the crawler."""
+    parser = argparse.ArgumentParser(description='Crawl plugin data from the JetBrains Marketplace.')
+    parser.add_argument('--fresh', '--no-resume', dest='resume', action='store_false',
+                        help='re-fetch every page instead of resuming a previous crawl')
+    args = parser.parse_args()
+
     try:
         crawler = JetBrainsMarketplaceCrawler()
-        total_plugins = crawler.crawl()
+        total_plugins = crawler.crawl(resume=args.resume)
         logger.info(f"Crawling completed. Total plugins: {total_plugins}")
     except Exception as e:
         logger.error(f"Unexpected error during crawling: {str(e)}")